@@ -1,7 +1,11 @@
+import io
 import streamlit as st
 import pandas as pd
 import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+import orjson
+from concurrent.futures import ThreadPoolExecutor
+from google.auth.transport.requests import AuthorizedSession, Request
+from google.oauth2.service_account import Credentials
 
 # Basic page configuration
 st.set_page_config(
@@ -11,12 +15,31 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-def format_name(name):
-    """Format name to capitalize only the first letter of each word."""
-    if pd.isna(name):
-        return name
-    # Split the name into words and capitalize only the first letter
-    return ' '.join(word.lower().capitalize() for word in str(name).split())
+def format_name(names):
+    """Format a column of names to capitalize only the first letter of each word."""
+    # Collapse runs of whitespace into single spaces, then title-case each word
+    return (
+        names.astype('string[pyarrow]')
+        .str.strip()
+        .str.replace(r'\s+', ' ', regex=True)
+        .str.title()
+    )
+
+def format_phone(phones):
+    """Normalize a column of phone numbers to their last 10 digits."""
+    return (
+        phones.astype('string[pyarrow]')
+        # Numbers read from spreadsheets may come through as floats like "5551234567.0"
+        .str.replace(r'\.0$', '', regex=True)
+        .str.replace(r'\D+', '', regex=True)
+        .str.slice(-10)
+    )
+
+def format_date(dates):
+    """Format a column of dates as YYYY-MM-DD strings, leaving unparseable values empty."""
+    # cache=True parses each distinct date string only once
+    parsed = pd.to_datetime(dates, cache=True, format='mixed', errors='coerce')
+    return parsed.dt.strftime('%Y-%m-%d')
 
 # Password protection
 def check_password():
@@ -44,46 +67,158 @@ def check_password():
     
     return st.session_state["password_correct"]
 
+def read_csv(file, sep=',', header=0):
+    """Read a delimited file with the PyArrow engine, falling back to the C engine."""
+    try:
+        return pd.read_csv(file, sep=sep, header=header, engine='pyarrow', dtype_backend='pyarrow')
+    except Exception:
+        # PyArrow may have consumed part of the buffer before failing
+        file.seek(0)
+        return pd.read_csv(file, sep=sep, header=header, engine='c', low_memory=False, dtype_backend='pyarrow')
+
+def read_excel(file, header=0):
+    """Read an Excel file with the calamine engine, falling back to openpyxl."""
+    try:
+        return pd.read_excel(file, header=header, engine='calamine', dtype_backend='pyarrow')
+    except Exception:
+        # Calamine may be unavailable or may have consumed part of the buffer
+        file.seek(0)
+        return pd.read_excel(file, header=header, engine='openpyxl', dtype_backend='pyarrow')
+
 def read_file(file, has_headers):
     """Read file based on its extension."""
+    # The buffer position can persist across reruns, so always read from the start
+    file.seek(0)
     try:
         if file.name.endswith('.csv'):
-            return pd.read_csv(file, header=0 if has_headers else None)
+            return read_csv(file, header=0 if has_headers else None)
         elif file.name.endswith('.xlsx'):
-            return pd.read_excel(file, header=0 if has_headers else None)
+            return read_excel(file, header=0 if has_headers else None)
         elif file.name.endswith('.txt'):
-            # First try comma separator
-            try:
-                df = pd.read_csv(file, sep=',', header=0 if has_headers else None)
-                # Check if we got more than one column
-                if len(df.columns) > 1:
-                    return df
-            except:
-                pass
-            
-            # If comma didn't work, try tab separator
-            return pd.read_csv(file, sep='\t', header=0 if has_headers else None)
+            # Pick the delimiter from a sample so the file is only parsed once
+            sample = file.read(4096)
+            file.seek(0)
+            if isinstance(sample, bytes):
+                sample = sample.decode('utf-8', errors='replace')
+            sep = '\t' if sample.count('\t') > sample.count(',') else ','
+            return read_csv(file, sep=sep, header=0 if has_headers else None)
         else:
             raise ValueError("Unsupported file format. Please upload CSV, XLSX, or TXT file.")
     except Exception as e:
         raise ValueError(f"Error reading file: {str(e)}")
 
-def save_to_gsheets(df, worksheet):
-    """Append dataframe to Google Sheets."""
+@st.cache_data(show_spinner=False)
+def read_file_cached(raw_bytes, file_name, has_headers):
+    """Read uploaded file contents, caching the result across reruns."""
+    file = io.BytesIO(raw_bytes)
+    file.name = file_name
+    return read_file(file, has_headers)
+
+# Google Sheets configuration
+SCOPE = ('https://spreadsheets.google.com/feeds',
+         'https://www.googleapis.com/auth/drive')
+SPREADSHEET_KEY = "1qWLg1vQHvJQG2hFHrUpO8y6bC8_xDdkLG2ErY_aGxkw"
+UPLOAD_CHUNK_SIZE = 5000
+# Chunk uploads share the cached client's requests session and credentials, neither of
+# which is documented as thread-safe, so keep concurrency low
+UPLOAD_MAX_WORKERS = 3
+
+SERVICE_ACCOUNT_INFO = {
+    "type": "service_account",
+    "project_id": "third-hangout-387516",
+    "client_email": "apollo-miner@third-hangout-387516.iam.gserviceaccount.com",
+    "client_id": "114223947184571105588",
+    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+    "token_uri": "https://oauth2.googleapis.com/token",
+    "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+    "client_x509_cert_url": "https://www.googleapis.com/robot/v1/metadata/x509/apollo-miner%40third-hangout-387516.iam.gserviceaccount.com",
+    "universe_domain": "googleapis.com"
+}
+
+class OrjsonSession(AuthorizedSession):
+    """AuthorizedSession that encodes JSON request bodies with orjson instead of the stdlib."""
+    def request(self, method, url, data=None, headers=None, json=None, **kwargs):
+        if json is not None:
+            data = orjson.dumps(json)
+            headers = {**(headers or {}), 'Content-Type': 'application/json'}
+        return super().request(method, url, data=data, headers=headers, **kwargs)
+
+@st.cache_resource(show_spinner=False)
+def get_gc():
+    """Authorize the gspread client once per server process."""
+    credentials_dict = {
+        **SERVICE_ACCOUNT_INFO,
+        "private_key_id": st.secrets["private_key_id"],
+        "private_key": st.secrets["google_credentials"]
+    }
+    credentials = Credentials.from_service_account_info(credentials_dict, scopes=SCOPE)
+    return gspread.Client(credentials, session=OrjsonSession(credentials))
+
+@st.cache_resource(show_spinner=False)
+def get_workbook():
+    """Open the spreadsheet once per server process."""
+    return get_gc().open_by_key(SPREADSHEET_KEY)
+
+@st.cache_resource(show_spinner=False)
+def get_worksheet(worksheet_name):
+    """Return a cached handle to the named worksheet."""
+    return get_workbook().worksheet(worksheet_name)
+
+def _write_rows_in_chunks(worksheet, rows, start_row):
+    """Write rows starting at start_row, sending chunks to Sheets concurrently.
+
+    Assumes the shared client tolerates a few concurrent requests; the credentials are
+    refreshed up front so the worker threads don't race to refresh the token.
+    """
+    requests = []
+    for offset in range(0, len(rows), UPLOAD_CHUNK_SIZE):
+        chunk = rows[offset:offset + UPLOAD_CHUNK_SIZE]
+        requests.append({
+            'valueInputOption': 'RAW',
+            'data': [{
+                'range': gspread.utils.absolute_range_name(worksheet.title, f'A{start_row + offset}'),
+                'majorDimension': 'ROWS',
+                'values': chunk
+            }]
+        })
+    
+    credentials = worksheet.spreadsheet.client.auth
+    if not credentials.valid:
+        credentials.refresh(Request())
+    
+    with ThreadPoolExecutor(max_workers=UPLOAD_MAX_WORKERS) as executor:
+        futures = [executor.submit(worksheet.spreadsheet.values_batch_update, body=body) for body in requests]
+        # Surface the first failure, if any
+        for future in futures:
+            future.result()
+
+def save_to_gsheets(df, worksheet, headers=None):
+    """Append dataframe to Google Sheets, or replace the sheet contents if headers are given."""
     try:
-        # Get the last row with data
-        last_row = len(worksheet.get_all_values())
-        
-        # Replace NaN values with empty strings
-        df_clean = df.fillna('')
+        # Convert to Python objects once, replacing missing values with empty strings;
+        # cast before filling because Arrow-backed numeric columns can't hold ''.
+        # Chunked uploads slice this list rather than rebuilding it
+        rows = df.astype(object).where(df.notna(), '').to_numpy().tolist()
         
-        # Append new records starting from the next row
-        worksheet.append_rows(
-            df_clean.values.tolist(),
-            value_input_option='RAW',
-            insert_data_option='INSERT_ROWS',
-            table_range=f'A{last_row + 1}'
-        )
+        if headers is not None:
+            worksheet.clear()
+            if len(rows) <= UPLOAD_CHUNK_SIZE:
+                # Rewrite the sheet from the top with headers and data in a single request
+                worksheet.update('A1', [headers] + rows, value_input_option='RAW')
+            else:
+                worksheet.update('A1', [headers], value_input_option='RAW')
+                _write_rows_in_chunks(worksheet, rows, start_row=2)
+        elif len(rows) <= UPLOAD_CHUNK_SIZE:
+            # Sheets appends after the last row with data, no need to look it up first
+            worksheet.append_rows(
+                rows,
+                value_input_option='RAW',
+                insert_data_option='INSERT_ROWS'
+            )
+        else:
+            # Chunks are written to fixed ranges, so find the first empty row once
+            start_row = len(worksheet.col_values(1)) + 1
+            _write_rows_in_chunks(worksheet, rows, start_row)
         return True
     except Exception as e:
         st.error(f"Error saving to Google Sheets: {str(e)}")
@@ -138,7 +273,7 @@ def main():
             has_headers = st.checkbox("File has headers", value=True)
             
             # Read the file
-            df = read_file(uploaded_file, has_headers)
+            df = read_file_cached(uploaded_file.getvalue(), uploaded_file.name, has_headers)
             
             # If no headers, generate column names
             if not has_headers:
@@ -149,84 +284,80 @@ def main():
             st.dataframe(df.head())
             
             # Column mapping
+            cols = df.columns.tolist()
             st.markdown("### Map Columns")
             st.markdown("Please select which columns contain the required information:")
             
-            if process == "Certo Market Visits Report":
-                col1, col2, col3 = st.columns(3)
-                
-                with col1:
-                    name_col = st.selectbox("Name Column", df.columns.tolist())
-                    email_col = st.selectbox("Email Column", df.columns.tolist())
-                
-                with col2:
-                    phone_col = st.selectbox("Phone Column", df.columns.tolist())
-                    reg_date_col = st.selectbox("Registration Date Column", df.columns.tolist())
-                
-                with col3:
-                    first_order_col = st.selectbox("First Order Date Column", df.columns.tolist())
-                    spent_col = st.selectbox("Spent Amount Column", df.columns.tolist())
-            else:
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    email_col = st.selectbox("Email Column", df.columns.tolist())
-                    first_name_col = st.selectbox("First Name Column", df.columns.tolist())
+            # Batch the mapping widgets in a form so picking columns does not rerun the script
+            with st.form("column_map"):
+                if process == "Certo Market Visits Report":
+                    col1, col2, col3 = st.columns(3)
+                    
+                    with col1:
+                        name_col = st.selectbox("Name Column", cols)
+                        email_col = st.selectbox("Email Column", cols)
+                    
+                    with col2:
+                        phone_col = st.selectbox("Phone Column", cols)
+                        reg_date_col = st.selectbox("Registration Date Column", cols)
+                    
+                    with col3:
+                        first_order_col = st.selectbox("First Order Date Column", cols)
+                        spent_col = st.selectbox("Spent Amount Column", cols)
+                else:
+                    col1, col2 = st.columns(2)
+                    
+                    with col1:
+                        email_col = st.selectbox("Email Column", cols)
+                        first_name_col = st.selectbox("First Name Column", cols)
+                    
+                    with col2:
+                        phone_col = st.selectbox("Phone Column", cols)
+                        # Add store number selection for Ferreira
+                        if process == "Ferreira":
+                            store_col = st.selectbox("Store Number Column", cols)
                 
-                with col2:
-                    phone_col = st.selectbox("Phone Column", df.columns.tolist())
-                    # Add store number selection for Ferreira
-                    if process == "Ferreira":
-                        store_col = st.selectbox("Store Number Column", df.columns.tolist())
+                # Process button
+                submitted = st.form_submit_button("Process Data")
             
-            # Process button
-            if st.button("Process Data"):
+            if submitted:
                 with st.spinner("Processing data and updating Google Sheets..."):
-                    # Create base dataframe
+                    # Create base dataframe from a single selection of the mapped columns.
+                    # Columns are renamed by position so mapping one column to several fields still works.
                     if process == "Certo Market Visits Report":
-                        # Convert dates to string format before creating DataFrame
-                        processed_df = pd.DataFrame({
-                            'Name': df[name_col].apply(format_name),
-                            'Email': df[email_col].str.lower(),
-                            'Phone': df[phone_col],
-                            'Registered Date': pd.to_datetime(df[reg_date_col]).dt.strftime('%Y-%m-%d'),
-                            'First Order Date': pd.to_datetime(df[first_order_col]).dt.strftime('%Y-%m-%d'),
-                            'Spent $': df[spent_col]
+                        processed_df = df[[name_col, email_col, phone_col, reg_date_col, first_order_col, spent_col]]
+                        processed_df.columns = ['Name', 'Email', 'Phone', 'Registered Date', 'First Order Date', 'Spent $']
+                        # Convert dates to string format
+                        processed_df = processed_df.assign(**{
+                            'Name': lambda d: format_name(d['Name']),
+                            'Email': lambda d: d['Email'].astype('string[pyarrow]').str.lower(),
+                            'Phone': lambda d: format_phone(d['Phone']),
+                            'Registered Date': lambda d: format_date(d['Registered Date']),
+                            'First Order Date': lambda d: format_date(d['First Order Date'])
                         })
                     else:
-                        processed_df = pd.DataFrame({
-                            'Email': df[email_col].str.lower(),
-                            'First Name': df[first_name_col].apply(format_name),
-                            'Phone': df[phone_col]
+                        processed_df = df[[email_col, first_name_col, phone_col]]
+                        processed_df.columns = ['Email', 'First Name', 'Phone']
+                        processed_df = processed_df.assign(**{
+                            'Email': lambda d: d['Email'].astype('string[pyarrow]').str.lower(),
+                            'Phone': lambda d: format_phone(d['Phone']),
+                            'First Name': lambda d: format_name(d['First Name'])
                         })
                     
                     # Add store number for Ferreira
                     if process == "Ferreira":
                         processed_df['Store Number'] = df[store_col]
                     
-                    # Setup Google Sheets connection
-                    scope = ['https://spreadsheets.google.com/feeds',
-                            'https://www.googleapis.com/auth/drive']
-                    credentials_dict = {
-                        "type": "service_account",
-                        "project_id": "third-hangout-387516",
-                        "private_key_id": st.secrets["private_key_id"],
-                        "private_key": st.secrets["google_credentials"],
-                        "client_email": "apollo-miner@third-hangout-387516.iam.gserviceaccount.com",
-                        "client_id": "114223947184571105588",
-                        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                        "token_uri": "https://oauth2.googleapis.com/token",
-                        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-                        "client_x509_cert_url": "https://www.googleapis.com/robot/v1/metadata/x509/apollo-miner%40third-hangout-387516.iam.gserviceaccount.com",
-                        "universe_domain": "googleapis.com"
-                    }
-                    
-                    credentials = ServiceAccountCredentials.from_json_keyfile_dict(credentials_dict, scope)
-                    gc = gspread.authorize(credentials)
-                    
-                    # Use the specific spreadsheet key
-                    spreadsheet_key = "1qWLg1vQHvJQG2hFHrUpO8y6bC8_xDdkLG2ErY_aGxkw"
-                    workbook = gc.open_by_key(spreadsheet_key)
+                    # Drop rows without an email, then repeated emails, before uploading
+                    missing_emails = int(processed_df['Email'].isna().sum())
+                    processed_df = processed_df.dropna(subset=['Email'])
+                    with_email_len = len(processed_df)
+                    processed_df = (
+                        processed_df
+                        .drop_duplicates(subset=['Email'], keep='first')
+                        .reset_index(drop=True)
+                    )
+                    duplicates_removed = with_email_len - len(processed_df)
                     
                     # Select worksheet based on process
                     if process == "Certo Market":
@@ -236,25 +367,25 @@ def main():
                     else:  # Certo Market Visits Report
                         worksheet_name = "Certo_Market_MKT_Report"
                     
-                    worksheet = workbook.worksheet(worksheet_name)
+                    worksheet = get_worksheet(worksheet_name)
                     
-                    # Clear the worksheet if it's Certo Market Visits Report
+                    # Replace the worksheet contents if it's Certo Market Visits Report
+                    headers = None
                     if process == "Certo Market Visits Report":
-                        worksheet.clear()
-                        # Add headers
                         headers = ['Name', 'Email', 'Phone', 'Registered Date', 'First Order Date', 'Spent $']
-                        worksheet.append_row(headers)
                     
                     # Save to Google Sheets
-                    if save_to_gsheets(processed_df, worksheet):
+                    if save_to_gsheets(processed_df, worksheet, headers):
                         st.success(f"✅ Data successfully processed and saved to {worksheet_name}!")
                         
                         # Display statistics
-                        col1, col2 = st.columns(2)
+                        col1, col2, col3 = st.columns(3)
                         with col1:
                             st.metric("Total Records", len(processed_df))
                         with col2:
-                            st.metric("Unique Emails", len(processed_df['Email'].unique()))
+                            st.metric("Duplicates Removed", duplicates_removed)
+                        with col3:
+                            st.metric("Missing Emails", missing_emails)
                     else:
                         st.error("❌ Failed to save data to Google Sheets.")
                 
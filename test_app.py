@@ -0,0 +1,134 @@
+import io
+from unittest.mock import MagicMock, patch
+
+import orjson
+import pandas as pd
+from google.auth.transport.requests import AuthorizedSession
+
+import app
+from app import format_date, format_name, format_phone, read_file, save_to_gsheets
+
+
+def test_save_to_gsheets_fills_nulls_in_arrow_numeric_columns():
+    df = pd.DataFrame({
+        'Email': pd.Series(['a@example.com', 'b@example.com'], dtype='string[pyarrow]'),
+        'Store Number': pd.Series([12, None], dtype='int64[pyarrow]'),
+        'Spent $': pd.Series([None, 9.5], dtype='double[pyarrow]'),
+    })
+    worksheet = MagicMock()
+
+    assert save_to_gsheets(df, worksheet)
+
+    rows = worksheet.append_rows.call_args.args[0]
+    assert rows == [['a@example.com', 12, ''], ['b@example.com', '', 9.5]]
+
+
+def _chunked_frame():
+    return pd.DataFrame({
+        'Email': pd.Series(['a@example.com', 'b@example.com', 'c@example.com'], dtype='string[pyarrow]'),
+        'Phone': pd.Series(['5551234567', None, '5559876543'], dtype='string[pyarrow]'),
+    })
+
+
+def _batch_update_bodies(worksheet):
+    calls = worksheet.spreadsheet.values_batch_update.call_args_list
+    assert all(call.args == () for call in calls)
+    return sorted((call.kwargs['body'] for call in calls), key=lambda body: body['data'][0]['range'])
+
+
+def test_save_to_gsheets_appends_large_frames_in_chunks(monkeypatch):
+    monkeypatch.setattr(app, 'UPLOAD_CHUNK_SIZE', 2)
+    worksheet = MagicMock()
+    worksheet.title = 'Ferreira'
+    worksheet.col_values.return_value = ['Email', 'x@example.com']
+
+    assert save_to_gsheets(_chunked_frame(), worksheet)
+
+    worksheet.append_rows.assert_not_called()
+    assert _batch_update_bodies(worksheet) == [
+        {
+            'valueInputOption': 'RAW',
+            'data': [{
+                'range': "'Ferreira'!A3",
+                'majorDimension': 'ROWS',
+                'values': [['a@example.com', '5551234567'], ['b@example.com', '']]
+            }]
+        },
+        {
+            'valueInputOption': 'RAW',
+            'data': [{
+                'range': "'Ferreira'!A5",
+                'majorDimension': 'ROWS',
+                'values': [['c@example.com', '5559876543']]
+            }]
+        },
+    ]
+
+
+def test_save_to_gsheets_replaces_large_frames_in_chunks(monkeypatch):
+    monkeypatch.setattr(app, 'UPLOAD_CHUNK_SIZE', 2)
+    worksheet = MagicMock()
+    worksheet.title = 'Certo_Market_MKT_Report'
+
+    assert save_to_gsheets(_chunked_frame(), worksheet, headers=['Email', 'Phone'])
+
+    worksheet.clear.assert_called_once()
+    worksheet.update.assert_called_once_with('A1', [['Email', 'Phone']], value_input_option='RAW')
+    worksheet.col_values.assert_not_called()
+    assert [body['data'][0]['range'] for body in _batch_update_bodies(worksheet)] == [
+        "'Certo_Market_MKT_Report'!A2",
+        "'Certo_Market_MKT_Report'!A4",
+    ]
+    assert [body['data'][0]['values'] for body in _batch_update_bodies(worksheet)] == [
+        [['a@example.com', '5551234567'], ['b@example.com', '']],
+        [['c@example.com', '5559876543']],
+    ]
+
+
+def test_orjson_session_encodes_json_bodies():
+    body = {'valueInputOption': 'RAW', 'data': [{'range': "'Ferreira'!A2", 'values': [['a@example.com', 12]]}]}
+
+    with patch.object(AuthorizedSession, 'request') as request:
+        app.OrjsonSession(MagicMock()).post('https://sheets.googleapis.com/v4/example', json=body)
+
+    kwargs = request.call_args.kwargs
+    assert kwargs['data'] == orjson.dumps(body)
+    assert kwargs['headers']['Content-Type'] == 'application/json'
+    assert 'json' not in kwargs
+
+
+def test_format_name_title_cases_and_collapses_whitespace():
+    names = pd.Series(['  JOHN   smith ', "o'brien", 'mary-jane WATSON', None])
+
+    assert format_name(names).tolist() == ['John Smith', "O'Brien", 'Mary-Jane Watson', pd.NA]
+
+
+def test_format_date_formats_mixed_inputs_and_blanks_bad_dates():
+    dates = pd.Series(['2024-01-05', '01/06/2024', 'not a date', None])
+
+    assert format_date(dates).fillna('').tolist() == ['2024-01-05', '2024-01-06', '', '']
+
+
+def _txt_file(content):
+    file = io.BytesIO(content.encode('utf-8'))
+    file.name = 'upload.txt'
+    return file
+
+
+def test_read_file_sniffs_tab_separated_txt():
+    df = read_file(_txt_file('Email\tName, Jr\tPhone\na@example.com\tAl, Jr\t555\n'), has_headers=True)
+
+    assert df.columns.tolist() == ['Email', 'Name, Jr', 'Phone']
+    assert df['Name, Jr'].tolist() == ['Al, Jr']
+
+
+def test_read_file_sniffs_comma_separated_txt():
+    df = read_file(_txt_file('Email,Name,Phone\na@example.com,Al,555\n'), has_headers=True)
+
+    assert df.columns.tolist() == ['Email', 'Name', 'Phone']
+
+
+def test_format_phone_keeps_last_ten_digits():
+    phones = pd.Series(['(555) 123-4567', '+1-555-123-4567', '5551234567.0', None])
+
+    assert format_phone(phones).tolist() == ['5551234567', '5551234567', '5551234567', pd.NA]